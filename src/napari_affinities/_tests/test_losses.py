@@ -0,0 +1,57 @@
+import pytest
+import torch
+
+from napari_affinities.training.losses import masked_mse_loss, masked_bce_loss
+
+
+def masked_inputs(prediction_shape, target_shape, mask_shape):
+    torch.manual_seed(0)
+    prediction = torch.rand(prediction_shape, dtype=torch.float64)
+    target = (torch.rand(target_shape) > 0.5).double()
+    mask = (torch.rand(mask_shape) > 0.3).double()
+    return prediction, target, mask
+
+
+def compare(loss_func, reference_func, prediction, target, mask):
+    prediction = prediction.clone().requires_grad_()
+    reference_prediction = prediction.detach().clone().requires_grad_()
+
+    loss = loss_func(prediction, target, mask)
+    reference = reference_func(reference_prediction * mask, target * mask)
+    loss.backward()
+    reference.backward()
+
+    torch.testing.assert_close(loss, reference)
+    torch.testing.assert_close(prediction.grad, reference_prediction.grad)
+
+
+def test_masked_mse_loss():
+    prediction, target, mask = masked_inputs(
+        (2, 3, 8, 8), (2, 3, 8, 8), (2, 3, 8, 8)
+    )
+    compare(masked_mse_loss, torch.nn.MSELoss(), prediction, target, mask)
+
+
+def test_masked_bce_loss():
+    prediction, target, mask = masked_inputs(
+        (2, 3, 8, 8), (2, 3, 8, 8), (2, 3, 8, 8)
+    )
+    compare(masked_bce_loss, torch.nn.BCELoss(), prediction, target, mask)
+
+
+def test_masked_losses_broadcast_mask():
+    # affinity masks are shared across channels
+    prediction, target, mask = masked_inputs(
+        (2, 3, 8, 8), (2, 3, 8, 8), (2, 1, 8, 8)
+    )
+    compare(masked_mse_loss, torch.nn.MSELoss(), prediction, target, mask)
+    compare(masked_bce_loss, torch.nn.BCELoss(), prediction, target, mask)
+
+
+def test_masked_bce_loss_shape_mismatch():
+    # only the mask broadcasts, like BCELoss on the masked tensors
+    prediction, target, mask = masked_inputs(
+        (2, 3, 8, 8), (2, 1, 8, 8), (2, 1, 8, 8)
+    )
+    with pytest.raises(ValueError):
+        masked_bce_loss(prediction, target, mask)
@@ -0,0 +1,161 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from xarray import DataArray
+
+from napari_affinities.bioimageio.helpers import predict_with_batched_tiling
+
+
+class IdentityPipeline:
+    """
+    Fake prediction pipeline that returns its input, recording the batch
+    size of every call
+    """
+
+    def __init__(self, input_shape, halo=(0, 0, 0, 0), output_shape=None):
+        axes = ("b", "c", "y", "x")
+        self.input_specs = [SimpleNamespace(axes=axes, shape=input_shape)]
+        if output_shape is None:
+            output_shape = SimpleNamespace(
+                reference_tensor="raw",
+                scale=[1.0, 1.0, 1.0, 1.0],
+                offset=[0, 0, 0, 0],
+            )
+        self.output_specs = [
+            SimpleNamespace(axes=axes, shape=output_shape, halo=list(halo))
+        ]
+        self.batch_sizes = []
+
+    def __call__(self, tensor):
+        input_shape = self.input_specs[0].shape
+        if isinstance(input_shape, list):
+            assert tensor.shape == tuple(input_shape)
+        else:
+            for size, min_size, step in zip(
+                tensor.shape, input_shape.min, input_shape.step
+            ):
+                assert size >= min_size
+                assert step > 0 or size == min_size
+                assert step == 0 or (size - min_size) % step == 0
+        self.batch_sizes.append(tensor.shape[0])
+        return [DataArray(tensor.values.copy(), dims=tensor.dims)]
+
+
+def parametrized(min_shape, step):
+    return SimpleNamespace(min=list(min_shape), step=list(step))
+
+
+def raw(*spatial_shape):
+    data = np.random.rand(1, 1, *spatial_shape).astype(np.float32)
+    return DataArray(data, dims=("b", "c", "y", "x"))
+
+
+def test_volume_smaller_than_tile():
+    pipeline = IdentityPipeline(parametrized((1, 1, 16, 16), (1, 0, 16, 16)))
+    data = raw(10, 12)
+
+    (output,) = predict_with_batched_tiling(pipeline, data)
+
+    assert output.dims == data.dims
+    np.testing.assert_allclose(output.values, data.values)
+    assert pipeline.batch_sizes == [1]
+
+
+def test_non_multiple_shape_with_halo():
+    pipeline = IdentityPipeline(
+        parametrized((1, 1, 32, 32), (1, 0, 0, 0)), halo=(0, 0, 4, 6)
+    )
+    data = raw(50, 70)
+
+    (output,) = predict_with_batched_tiling(pipeline, data, max_batch=4)
+
+    np.testing.assert_allclose(output.values, data.values, rtol=1e-6)
+    # 3 x 4 tiles of inner shape (24, 20) split into batches of 4
+    assert pipeline.batch_sizes == [4, 4, 4]
+
+
+def test_fixed_input_shape():
+    pipeline = IdentityPipeline([2, 1, 32, 32], halo=(0, 0, 2, 2))
+    data = raw(40, 45)
+
+    (output,) = predict_with_batched_tiling(pipeline, data)
+
+    np.testing.assert_allclose(output.values, data.values, rtol=1e-6)
+    # 2 x 2 tiles, every batch has the fixed size
+    assert pipeline.batch_sizes == [2, 2]
+
+
+def test_batch_without_step():
+    pipeline = IdentityPipeline(parametrized((3, 1, 16, 16), (0, 0, 0, 0)))
+    data = raw(40, 40)
+
+    (output,) = predict_with_batched_tiling(pipeline, data)
+
+    np.testing.assert_allclose(output.values, data.values)
+    # 3 x 3 tiles, capped at the only allowed batch size
+    assert pipeline.batch_sizes == [3, 3, 3]
+
+
+def test_batch_with_step():
+    # 3 tiles don't fit the allowed batch sizes 2, 4, ...
+    pipeline = IdentityPipeline(parametrized((2, 1, 16, 16), (2, 0, 0, 0)))
+    data = raw(16, 48)
+
+    (output,) = predict_with_batched_tiling(pipeline, data, max_batch=5)
+
+    np.testing.assert_allclose(output.values, data.values)
+    # capped at 4, the largest allowed size below 5, then padded to 4
+    assert pipeline.batch_sizes == [4]
+
+
+def test_batch_below_min():
+    pipeline = IdentityPipeline(parametrized((4, 1, 16, 16), (1, 0, 0, 0)))
+    data = raw(16, 48)
+
+    (output,) = predict_with_batched_tiling(pipeline, data, max_batch=2)
+
+    np.testing.assert_allclose(output.values, data.values)
+    # 3 tiles padded up to the minimum batch size
+    assert pipeline.batch_sizes == [4]
+
+
+def test_unsupported_models():
+    shape = parametrized((1, 1, 16, 16), (1, 0, 16, 16))
+
+    # more than one sample
+    pipeline = IdentityPipeline(shape)
+    data = DataArray(
+        np.zeros((2, 1, 16, 16), dtype=np.float32),
+        dims=("b", "c", "y", "x"),
+    )
+    with pytest.raises(NotImplementedError):
+        predict_with_batched_tiling(pipeline, data)
+
+    # data axes don't match the model
+    with pytest.raises(NotImplementedError):
+        predict_with_batched_tiling(
+            pipeline, raw(16, 16).transpose("b", "c", "x", "y")
+        )
+
+    # fixed output shape
+    pipeline = IdentityPipeline(shape, output_shape=[1, 1, 16, 16])
+    with pytest.raises(NotImplementedError):
+        predict_with_batched_tiling(pipeline, raw(16, 16))
+
+    # resizing output
+    pipeline = IdentityPipeline(
+        shape,
+        output_shape=SimpleNamespace(
+            reference_tensor="raw",
+            scale=[1.0, 1.0, 2.0, 2.0],
+            offset=[0, 0, 0, 0],
+        ),
+    )
+    with pytest.raises(NotImplementedError):
+        predict_with_batched_tiling(pipeline, raw(16, 16))
+
+    # halo leaves no valid output in a tile
+    pipeline = IdentityPipeline([1, 1, 16, 16], halo=(0, 0, 8, 8))
+    with pytest.raises(NotImplementedError):
+        predict_with_batched_tiling(pipeline, raw(16, 16))
@@ -2,6 +2,11 @@ from bioimageio.core.resource_io.nodes import Model, ImportedSource
 
 from marshmallow import missing
 import torch
+import numpy as np
+from xarray import DataArray
+
+from typing import List, Optional, Tuple
+import itertools
 
 
 def get_torch_module(model: Model) -> torch.nn.Module:
@@ -31,6 +36,240 @@ def get_torch_module(model: Model) -> torch.nn.Module:
     return model
 
 
+def preferred_weight_format(
+    model: Model, exclude: Tuple[str, ...] = ()
+) -> Optional[str]:
+    """
+    Pick the weight format to run inference with. Exported torchscript
+    weights avoid python dispatch in the forward pass so they are preferred
+    over the state dict whenever the model provides them. Formats in
+    `exclude`, e.g. ones that failed before, are skipped.
+    """
+    for weight_format in ("torchscript", "pytorch_state_dict"):
+        if weight_format in model.weights and weight_format not in exclude:
+            return weight_format
+    return None
+
+
+def has_processing(model: Model) -> bool:
+    """
+    Whether any input or output of `model` defines pre- or postprocessing
+    """
+    return any(
+        inp.preprocessing is not missing and len(inp.preprocessing) > 0
+        for inp in model.inputs
+    ) or any(
+        outp.postprocessing is not missing and len(outp.postprocessing) > 0
+        for outp in model.outputs
+    )
+
+
+class ModulePredictor:
+    """
+    Stand-in for a bioimageio prediction pipeline that runs an in memory
+    torch module directly. No pre- or postprocessing is applied, so this
+    only matches the bioimageio pipeline for models without any, see
+    `has_processing`.
+    """
+
+    def __init__(
+        self, model: Model, module: torch.nn.Module, device: torch.device
+    ):
+        self.input_specs = model.inputs
+        self.output_specs = model.outputs
+        self.module = module
+        self.device = device
+
+    def forward(self, *input_tensors: DataArray) -> List[DataArray]:
+        with torch.no_grad():
+            outputs = self.module(
+                *(
+                    torch.as_tensor(tensor.values, device=self.device).float()
+                    for tensor in input_tensors
+                )
+            )
+        if isinstance(outputs, torch.Tensor):
+            outputs = [outputs]
+        return [
+            DataArray(output.cpu().numpy(), dims=tuple(output_spec.axes))
+            for output, output_spec in zip(outputs, self.output_specs)
+        ]
+
+    def __call__(self, *input_tensors: DataArray) -> List[DataArray]:
+        return self.forward(*input_tensors)
+
+
+def drop_exported_weights(model: Model):
+    """
+    Remove all weights that are not the pytorch state dict. Called whenever
+    the state dict is replaced by finetuned weights since any exported
+    weights would be stale afterwards.
+    """
+    for weight_format in list(model.weights.keys()):
+        if weight_format != "pytorch_state_dict":
+            del model.weights[weight_format]
+
+
+def _tile_shape(input_spec, data_shape, halo):
+    """
+    Pick a tile shape for every spatial axis of `input_spec`. Fixed input
+    shapes are used as is, parametrized shapes are grown from `min` by `step`
+    following the same heuristic as `bioimageio.core.prediction`.
+    """
+    axes = tuple(input_spec.axes)
+    min_len = 64 if "z" in axes else 256
+    if isinstance(input_spec.shape, list):
+        return {
+            ax: sh for ax, sh in zip(axes, input_spec.shape) if ax in "zyx"
+        }
+    tile_shape = {}
+    for ax, min_ax, step_ax in zip(
+        axes, input_spec.shape.min, input_spec.shape.step
+    ):
+        if ax not in "zyx":
+            continue
+        len_ax = min_ax
+        max_len = min(min_len, data_shape[ax] + 2 * halo[ax])
+        while step_ax > 0 and len_ax < max_len:
+            len_ax += step_ax
+        tile_shape[ax] = len_ax
+    return tile_shape
+
+
+def predict_with_batched_tiling(
+    prediction_pipeline, data: DataArray, max_batch: int = 8
+) -> List[DataArray]:
+    """
+    Predict on `data` by splitting it into model sized tiles and passing
+    up to `max_batch` tiles through the prediction pipeline at once.
+    Only the halo-free center of each tile is kept, overlapping tiles at
+    the volume border are averaged.
+    """
+    input_spec = prediction_pipeline.input_specs[0]
+    output_specs = prediction_pipeline.output_specs
+    axes = tuple(input_spec.axes)
+    if tuple(data.dims) != axes or axes[:2] != ("b", "c"):
+        raise NotImplementedError(
+            f"Batched tiling expects data with axes ('b', 'c', ...), got {data.dims}"
+        )
+    if data.shape[0] != 1:
+        raise NotImplementedError("Batched tiling expects a single sample")
+    spatial_axes = axes[2:]
+    if not all(ax in "zyx" for ax in spatial_axes):
+        raise NotImplementedError(f"Can't tile along axes: {spatial_axes}")
+
+    # tiling is only supported if every output matches the input spatially
+    halo = {ax: 0 for ax in spatial_axes}
+    for output_spec in output_specs:
+        if tuple(output_spec.axes) != axes:
+            raise NotImplementedError(
+                f"Output axes {output_spec.axes} don't match input axes {axes}"
+            )
+        if not hasattr(output_spec.shape, "scale"):
+            raise NotImplementedError(
+                "Can't tile models with fixed output shapes"
+            )
+        for ax, scale, offset in zip(
+            axes, output_spec.shape.scale, output_spec.shape.offset
+        ):
+            if ax in spatial_axes and (scale != 1 or offset != 0):
+                raise NotImplementedError("Can't tile models that resize")
+        if output_spec.halo is not missing and output_spec.halo is not None:
+            for ax, ha in zip(axes, output_spec.halo):
+                if ax in spatial_axes:
+                    halo[ax] = max(halo[ax], ha)
+
+    data_shape = dict(zip(axes, data.shape))
+    tile_shape = _tile_shape(input_spec, data_shape, halo)
+    inner_shape = {ax: tile_shape[ax] - 2 * halo[ax] for ax in spatial_axes}
+    if any(inner_shape[ax] <= 0 for ax in spatial_axes):
+        raise NotImplementedError(
+            f"Tile shape {tile_shape} too small for halo {halo}"
+        )
+    # batch sizes allowed by the spec are `min_batch + k * batch_step`.
+    # Batches are capped at the largest allowed size not above `max_batch`
+    # and incomplete batches are padded up to the next allowed size
+    if isinstance(input_spec.shape, list):
+        min_batch, batch_step = input_spec.shape[0], 0
+    else:
+        min_batch, batch_step = (
+            input_spec.shape.min[0],
+            input_spec.shape.step[0],
+        )
+    if batch_step == 0 or max_batch <= min_batch:
+        max_batch = min_batch
+    else:
+        max_batch -= (max_batch - min_batch) % batch_step
+
+    # pad so that every tile, including the ones at the border, has full size
+    padding = [(0, 0), (0, 0)] + [
+        (halo[ax], halo[ax] + max(inner_shape[ax] - data_shape[ax], 0))
+        for ax in spatial_axes
+    ]
+    padded = np.pad(data.values, padding, mode="reflect")[0]
+
+    # tile origins in output space. The last tile is shifted back to end
+    # at the volume border rather than extending past it
+    origins = []
+    for ax in spatial_axes:
+        last = max(data_shape[ax] - inner_shape[ax], 0)
+        origins.append(sorted(set(range(0, last, inner_shape[ax])) | {last}))
+    tiles = list(itertools.product(*origins))
+
+    spatial_shape = tuple(data_shape[ax] for ax in spatial_axes)
+    results = None
+    counts = np.zeros((1, 1, *spatial_shape), dtype=np.float32)
+    for batch_start in range(0, len(tiles), max_batch):
+        batch_tiles = tiles[batch_start : batch_start + max_batch]
+        batch = [
+            padded[
+                (slice(None),)
+                + tuple(
+                    slice(o, o + tile_shape[ax])
+                    for o, ax in zip(origin, spatial_axes)
+                )
+            ]
+            for origin in batch_tiles
+        ]
+        # pad incomplete batches to a batch size the model accepts
+        num_tiles = len(batch)
+        batch_size = max(num_tiles, min_batch)
+        if batch_step > 0:
+            batch_size += -(batch_size - min_batch) % batch_step
+        batch.extend(batch[-1:] * (batch_size - num_tiles))
+        outputs = prediction_pipeline(DataArray(np.stack(batch), dims=axes))
+
+        if results is None:
+            results = [
+                np.zeros(
+                    (1, output.shape[1], *spatial_shape), dtype=np.float32
+                )
+                for output in outputs
+            ]
+        for i, origin in enumerate(batch_tiles[:num_tiles]):
+            target = (slice(None), slice(None)) + tuple(
+                slice(o, min(o + inner_shape[ax], data_shape[ax]))
+                for o, ax in zip(origin, spatial_axes)
+            )
+            source = tuple(
+                slice(
+                    halo[ax],
+                    halo[ax] + min(inner_shape[ax], data_shape[ax] - o),
+                )
+                for o, ax in zip(origin, spatial_axes)
+            )
+            for result, output in zip(results, outputs):
+                result[target] += output.values[
+                    (slice(i, i + 1), slice(None)) + source
+                ]
+            counts[target] += 1
+
+    return [
+        DataArray(result / counts, dims=tuple(output_spec.axes))
+        for result, output_spec in zip(results, output_specs)
+    ]
+
+
 def update_weights(model, weights):
     """
     Package up a trained/finetuned model as a new bioimageio model
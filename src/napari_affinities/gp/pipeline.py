@@ -16,6 +16,8 @@ from contextlib import contextmanager
 from typing import List, Tuple, Optional, Dict, Any
 from dataclasses import dataclass
 import math
+import queue
+import threading
 
 LayerName = str
 LayerType = str
@@ -64,17 +66,71 @@ class PipelineDataGenerator:
         self.keys = keys
         self.spatial_axes = axes
 
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prefetch_thread = None
+        self._prefetched = None
+
+    def start_prefetching(self, num_batches: int = 2):
+        """
+        Request training batches in a background thread so the next batch
+        is assembled while the current one is being trained on.
+        """
+        self._stop.clear()
+        self._prefetched = queue.Queue(maxsize=num_batches)
+        self._prefetch_thread = threading.Thread(
+            target=self._prefetch, daemon=True
+        )
+        self._prefetch_thread.start()
+
+    def stop_prefetching(self):
+        if self._prefetch_thread is None:
+            return
+        self._stop.set()
+        self._prefetch_thread.join()
+        self._prefetch_thread = None
+        self._prefetched = None
+
+    def _prefetch(self):
+        while not self._stop.is_set():
+            try:
+                batch = self._next(False)
+            except Exception as e:
+                # hand the error to the training loop instead of dying quietly
+                batch = e
+            while not self._stop.is_set():
+                try:
+                    self._prefetched.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if isinstance(batch, Exception):
+                return
+
     def next(
         self, snapshot: bool
     ) -> Tuple[
         List[Tuple[np.ndarray, Dict[str, Any], LayerType]],
         List[Tuple[np.ndarray, Dict[str, Any], LayerType]],
+    ]:
+        # snapshots need a different request so they are never prefetched
+        if snapshot or self._prefetch_thread is None:
+            return self._next(snapshot)
+        batch = self._prefetched.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def _next(self, snapshot: bool) -> Tuple[
+        List[Tuple[np.ndarray, Dict[str, Any], LayerType]],
+        List[Tuple[np.ndarray, Dict[str, Any], LayerType]],
     ]:
         request = gp.BatchRequest()
         request_template = self.snapshot_request if snapshot else self.request
         for k, v in request_template.items():
             request[k] = v
-        batch = self.pipeline.request_batch(request)
+        with self._lock:
+            batch = self.pipeline.request_batch(request)
 
         arrays = []
         snapshot_arrays = []
@@ -384,7 +440,7 @@ def build_pipeline(
 
     with gp.build(pipeline):
         with gp.build(val_pipeline):
-            yield PipelineDataGenerator(
+            data_generator = PipelineDataGenerator(
                 pipeline,
                 val_pipeline,
                 request,
@@ -393,3 +449,8 @@ def build_pipeline(
                 keys,
                 axes=spatial_axes,
             )
+            data_generator.start_prefetching()
+            try:
+                yield data_generator
+            finally:
+                data_generator.stop_prefetching()
@@ -0,0 +1,48 @@
+import torch
+
+from typing import Callable
+import warnings
+
+
+def supports_compile(device: torch.device) -> bool:
+    """
+    Whether `torch.compile` can generate kernels for `device`. Inductor
+    needs a usable triton install and a cuda capability of at least 7.0,
+    without them compiled functions raise on their first call.
+    """
+    if not hasattr(torch, "compile") or device.type != "cuda":
+        return False
+    if torch.cuda.get_device_capability(device) < (7, 0):
+        return False
+    try:
+        from torch.utils._triton import has_triton
+    except ImportError:
+        try:
+            import triton
+        except ImportError:
+            return False
+        return True
+    return has_triton()
+
+
+class CompiledWithFallback:
+    """
+    Calls `fn` through `torch.compile`. If a compiled call fails, e.g.
+    because kernels can't be generated on this machine, a warning is
+    emitted and `fn` is called eagerly from then on.
+    """
+
+    def __init__(self, fn: Callable, **compile_kwargs):
+        self.fn = fn
+        self.compiled = torch.compile(fn, **compile_kwargs)
+
+    def __call__(self, *args, **kwargs):
+        if self.compiled is not None:
+            try:
+                return self.compiled(*args, **kwargs)
+            except Exception as e:
+                warnings.warn(
+                    f"Compiled call failed ({e}), running eagerly instead"
+                )
+                self.compiled = None
+        return self.fn(*args, **kwargs)
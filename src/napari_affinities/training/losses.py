@@ -0,0 +1,30 @@
+import torch
+
+
+def masked_mse_loss(
+    prediction: torch.Tensor, target: torch.Tensor, mask: torch.Tensor
+) -> torch.Tensor:
+    """
+    Mean squared error between `prediction` and `target` with masked out
+    voxels contributing 0. Same result as
+    `MSELoss()(prediction * mask, target * mask)` without materializing
+    both masked tensors.
+    """
+    difference = (prediction - target) * mask
+    return (difference * difference).mean()
+
+
+def masked_bce_loss(
+    prediction: torch.Tensor, target: torch.Tensor, mask: torch.Tensor
+) -> torch.Tensor:
+    """
+    Binary cross entropy between `prediction` and `target` with masked out
+    voxels contributing 0. Same result as
+    `BCELoss()(prediction * mask, target * mask)` for binary masks, but the
+    mask is applied as a per voxel weight instead of materializing both
+    masked tensors.
+    """
+    # only the mask is broadcast, prediction and target shapes must match
+    return torch.nn.functional.binary_cross_entropy(
+        prediction, target, weight=mask.expand_as(prediction)
+    )
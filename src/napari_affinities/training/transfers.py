@@ -0,0 +1,140 @@
+import numpy as np
+import torch
+
+from typing import Dict, Hashable, List, Optional, Sequence
+
+
+class HostToDevice:
+    """
+    Copies numpy arrays to a torch device as float32 tensors.
+    On cuda devices the arrays are staged in reusable pinned buffers and
+    copied on a separate stream so the transfer doesn't block the host.
+    Call `wait` before using the returned tensors on the current stream.
+    Tensors with a matching number of dimensions are converted to
+    `memory_format` on the device.
+    """
+
+    def __init__(
+        self,
+        device: torch.device,
+        memory_format: Optional[torch.memory_format] = None,
+    ):
+        self.device = device
+        self.memory_format = memory_format
+        self._memory_format_ndim = {
+            torch.channels_last: 4,
+            torch.channels_last_3d: 5,
+        }.get(memory_format)
+        self.pinned = device.type == "cuda"
+        self.stream = torch.cuda.Stream(device) if self.pinned else None
+        self._buffers: Dict[Hashable, torch.Tensor] = {}
+        self._events: Dict[Hashable, torch.cuda.Event] = {}
+
+    def __call__(self, key: Hashable, array: np.ndarray) -> torch.Tensor:
+        if not self.pinned:
+            return torch.as_tensor(array, device=self.device).float()
+
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != array.shape:
+            buffer = torch.empty(
+                array.shape, dtype=torch.float32, pin_memory=True
+            )
+            self._buffers[key] = buffer
+        elif key in self._events:
+            # the previous copy out of this buffer may still be in flight
+            self._events[key].synchronize()
+        np.copyto(buffer.numpy(), array, casting="unsafe")
+
+        with torch.cuda.stream(self.stream):
+            tensor = buffer.to(self.device, non_blocking=True)
+            if tensor.dim() == self._memory_format_ndim:
+                tensor = tensor.contiguous(memory_format=self.memory_format)
+            event = torch.cuda.Event()
+            event.record(self.stream)
+        self._events[key] = event
+        # allocated on the copy stream but used on the current stream
+        tensor.record_stream(torch.cuda.current_stream(self.device))
+        return tensor
+
+    def wait(self):
+        """
+        Make the current stream wait for all issued copies.
+        """
+        if self.pinned:
+            torch.cuda.current_stream(self.device).wait_stream(self.stream)
+
+
+class DeviceToHost:
+    """
+    Copies tensors off a torch device as numpy arrays.
+    On cuda devices the copies go into a reusable pinned buffer on a
+    separate stream so they can overlap with further work on the current
+    stream. Call `wait` to get the arrays.
+    """
+
+    def __init__(self, device: torch.device):
+        self.device = device
+        self.pinned = device.type == "cuda"
+        self.stream = torch.cuda.Stream(device) if self.pinned else None
+        self._block: Optional[torch.Tensor] = None
+        self._hosts: List[torch.Tensor] = []
+        self._event = None
+
+    def __call__(self, tensors: Sequence[torch.Tensor]):
+        tensors = [tensor.detach() for tensor in tensors]
+        if not self.pinned:
+            self._hosts = [tensor.cpu() for tensor in tensors]
+            return
+
+        # the buffer is reused, previous copies have to be done
+        if self._event is not None:
+            self._event.synchronize()
+            self._event = None
+
+        # all copies share a single pinned allocation with the dtype of the
+        # first tensor, pinning memory is expensive compared to the copies.
+        # It only grows when a larger total size is requested.
+        numel = sum(tensor.numel() for tensor in tensors)
+        if (
+            self._block is None
+            or self._block.numel() < numel
+            or self._block.dtype != tensors[0].dtype
+        ):
+            self._block = torch.empty(
+                numel, dtype=tensors[0].dtype, pin_memory=True
+            )
+        self._hosts = []
+        offset = 0
+        for tensor in tensors:
+            self._hosts.append(
+                self._block[offset : offset + tensor.numel()].view(
+                    tensor.shape
+                )
+            )
+            offset += tensor.numel()
+
+        # the tensors are produced by work queued on the current stream
+        self.stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(self.stream):
+            for host, tensor in zip(self._hosts, tensors):
+                host.copy_(tensor, non_blocking=True)
+            self._event = torch.cuda.Event()
+            self._event.record(self.stream)
+        for tensor in tensors:
+            tensor.record_stream(self.stream)
+
+    def wait(self) -> List[np.ndarray]:
+        """
+        Block until all issued copies are done and return them. The arrays
+        are copied out of the pinned buffer since it is reused by the next
+        call and shouldn't be kept alive by the callers.
+        """
+        if self._event is not None:
+            self._event.synchronize()
+            self._event = None
+        arrays = [
+            host.numpy().copy() if self.pinned else host.numpy()
+            for host in self._hosts
+        ]
+        self._hosts = []
+        return arrays
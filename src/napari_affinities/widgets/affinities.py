@@ -2,8 +2,18 @@
 from copy import deepcopy
 from ..gp.pipeline import GunpowderParameters, build_pipeline
 from .gui_helpers import layer_choice_widget, MplCanvas
-from ..bioimageio.helpers import get_torch_module
+from ..bioimageio.helpers import (
+    get_torch_module,
+    predict_with_batched_tiling,
+    preferred_weight_format,
+    drop_exported_weights,
+    has_processing,
+    ModulePredictor,
+)
 from .fov import get_fov_data
+from ..training.transfers import HostToDevice, DeviceToHost
+from ..training.losses import masked_mse_loss, masked_bce_loss
+from ..training.compile import supports_compile, CompiledWithFallback
 
 # github repo libraries
 import gunpowder as gp
@@ -41,9 +51,53 @@ from qtpy.QtWidgets import (
 
 # python built in libraries
 from pathlib import Path
-from typing import Optional, Dict, List
-from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple, NamedTuple
+from contextlib import contextmanager, ExitStack
 import dataclasses
+import threading
+import time
+import warnings
+
+
+class LayerMeta(NamedTuple):
+    """
+    Layer information that only depends on the layer axes
+    """
+
+    batch_dim: int
+    spatial_axes: Tuple[str, ...]
+
+
+@dataclasses.dataclass
+class PreparedLayer:
+    """
+    A layer ready to be added to the viewer, see `ModelWidget.prepare_layers`
+    """
+
+    name: str
+    axes: Tuple[str, ...]
+    meta: LayerMeta
+    data: np.ndarray
+    full_data: np.ndarray
+    slices: Tuple[slice, ...]
+    overwrite: bool
+    metadata: Dict
+    layer_type: str
+
+
+@dataclasses.dataclass
+class CachedPipeline:
+    """
+    A cached bioimageio prediction pipeline, see
+    `ModelWidget.prediction_pipeline`. Stale pipelines are closed by their
+    last user.
+    """
+
+    key: Tuple
+    pipeline: object
+    stack: ExitStack
+    users: int = 0
+    stale: bool = False
 
 
 class ModelWidget(QWidget):
@@ -54,10 +108,26 @@ class ModelWidget(QWidget):
 
         # initialize state variables
         self.__training_generator = None
+        self.__layer_buffers = {}
+        self.__layer_meta = {}
+        self.__prediction_pipeline = None
+        # guards swapping the cached pipeline, it is used from worker
+        # threads and closed from the GUI thread
+        self.__prediction_pipeline_lock = threading.Lock()
+        # weight formats that failed to predict, keyed by model id
+        self.__failed_weight_formats = {}
+        self.__device = torch.device(
+            "cuda" if torch.cuda.is_available() else "cpu"
+        )
 
         # supported axes
         self.__axes = ["batch", "channel", "time", "z", "y", "x"]
         self._validation_interval = 100
+        self._max_prediction_batch = 8
+        self._lsd_loss_weight = 1.0
+        # minimum number of seconds between redraws of the progress plot
+        self._plot_update_interval = 0.1
+        self.__last_plot_update = 0.0
         self.__model = None
 
         # Widget layout
@@ -155,6 +225,9 @@ class ModelWidget(QWidget):
         # activate layout
         self.setLayout(layout)
 
+        # free snapshot buffers of layers that are removed from the viewer
+        napari_viewer.layers.events.removed.connect(self.drop_layer_buffer)
+
         # Widget state
         self.model = None
 
@@ -174,6 +247,8 @@ class ModelWidget(QWidget):
     @model.setter
     def model(self, new_model: Optional[Model]):
         self.reset_training_state()
+        self.close_prediction_pipeline()
+        self.__failed_weight_formats = {}
         self.__model = new_model
         if new_model is not None:
             self.model_label.setText(new_model.name)
@@ -184,6 +259,13 @@ class ModelWidget(QWidget):
         else:
             self.model_label.setText("None")
 
+    @property
+    def device(self) -> torch.device:
+        """
+        Device used for training and prediction, picked once on startup
+        """
+        return self.__device
+
     @property
     def training_parameters(self) -> GunpowderParameters:
         parameters = GunpowderParameters(
@@ -243,10 +325,86 @@ class ModelWidget(QWidget):
         ) as pipeline:
             yield pipeline
 
+    @contextmanager
+    def prediction_pipeline(self, model, weight_format):
+        """
+        Use a bioimageio prediction pipeline for `model` running
+        `weight_format` weights. The pipeline is kept alive between
+        predictions and only rebuilt once the model or the weights it would
+        load change.
+        """
+        weights = model.weights.get(weight_format)
+        key = (
+            id(model),
+            weight_format,
+            str(weights.source) if weights is not None else None,
+        )
+        with self.__prediction_pipeline_lock:
+            cached = self.__prediction_pipeline
+            if cached is None or cached.key != key:
+                self._retire_prediction_pipeline()
+                stack = ExitStack()
+                pipeline = stack.enter_context(
+                    create_prediction_pipeline(
+                        bioimageio_model=model,
+                        devices=[str(self.device)],
+                        weight_format=weight_format,
+                    )
+                )
+                cached = CachedPipeline(key, pipeline, stack)
+                self.__prediction_pipeline = cached
+            cached.users += 1
+        try:
+            yield cached.pipeline
+        finally:
+            with self.__prediction_pipeline_lock:
+                cached.users -= 1
+                close = cached.stale and cached.users == 0
+            if close:
+                cached.stack.close()
+
+    def _retire_prediction_pipeline(self):
+        """
+        Drop the cached pipeline. It is closed right away if unused,
+        otherwise by its last user. Called with the pipeline lock held.
+        """
+        cached = self.__prediction_pipeline
+        self.__prediction_pipeline = None
+        if cached is not None:
+            cached.stale = True
+            if cached.users == 0:
+                cached.stack.close()
+
+    def close_prediction_pipeline(self):
+        """
+        Close the cached prediction pipeline. A pipeline still used by a
+        running prediction is closed once that prediction finishes.
+        """
+        with self.__prediction_pipeline_lock:
+            self._retire_prediction_pipeline()
+
+    @contextmanager
+    def free_prediction_pipeline(self):
+        """
+        Close the cached prediction pipeline on entry and exit. Used while
+        training, where it would keep a second copy of the model on the
+        device and pipelines for online predictions outlive the training.
+        """
+        self.close_prediction_pipeline()
+        try:
+            yield
+        finally:
+            self.close_prediction_pipeline()
+
+    def closeEvent(self, event):
+        self.close_prediction_pipeline()
+        super().closeEvent(event)
+
     def reset_training_state(self, keep_stats=False):
         if self.__training_generator is not None:
             self.__training_generator.quit()
         self.__training_generator = None
+        self.__layer_buffers = {}
         if not keep_stats:
             self.iteration = 0
             self.__iterations = []
@@ -453,9 +611,9 @@ class ModelWidget(QWidget):
                     "image",
                 ),
             )
-        return prediction_layers
+        return self.prepare_layers(prediction_layers)
 
-    def _predict(self, model, raw_data, offsets):
+    def _predict(self, model, raw_data, offsets, prediction_pipeline=None):
         ndim = len(offsets[0])
 
         outputs = model.outputs
@@ -499,24 +657,44 @@ class ModelWidget(QWidget):
         while len(raw_data.shape) < ndim + 2:
             raw_data = raw_data.reshape((1, *raw_data.shape))
 
-        with create_prediction_pipeline(
-            bioimageio_model=model, devices=["cuda"]
-        ) as pp:
-            # [0] to access first input array/output array
-            pred_data = DataArray(raw_data, dims=tuple(pp.input_specs[0].axes))
+        if prediction_pipeline is not None:
+            outputs = self._run_prediction(prediction_pipeline, raw_data)
+        else:
+            weight_format = preferred_weight_format(
+                model, self.__failed_weight_formats.get(id(model), ())
+            )
             try:
-                outputs = list(
-                    predict_with_tiling(pp, pred_data, True, verbose=True)
+                with self.prediction_pipeline(model, weight_format) as pp:
+                    outputs = self._run_prediction(pp, raw_data)
+            except (RuntimeError, torch.jit.Error) as e:
+                # out of memory errors are unrelated to the weights
+                out_of_memory = "out of memory" in str(e)
+                if out_of_memory or weight_format in (
+                    None,
+                    "pytorch_state_dict",
+                ):
+                    raise
+                # exported weights may only support the shapes they were
+                # exported with, use the state dict from now on
+                warnings.warn(
+                    f"Predicting with {weight_format} weights failed "
+                    f"({e}), falling back to pytorch_state_dict weights"
                 )
-            except NotImplementedError as e:
-                outputs = list(pp(pred_data))
+                self.__failed_weight_formats[id(model)] = (
+                    *self.__failed_weight_formats.get(id(model), ()),
+                    weight_format,
+                )
+                with self.prediction_pipeline(
+                    model, "pytorch_state_dict"
+                ) as pp:
+                    outputs = self._run_prediction(pp, raw_data)
 
         affs = outputs[affs_index].values
 
         result = [None for _ in output_names]
 
         # remove batch dimensions
-        pred_data = pred_data.squeeze()
+        pred_data = raw_data.squeeze()
         affs = affs.squeeze()
         result[affs_index] = affs
         if lsds:
@@ -544,6 +722,24 @@ class ModelWidget(QWidget):
 
         return tuple(result)
 
+    def _run_prediction(self, pp, raw_data):
+        """
+        Run `pp` on `raw_data`, tiling it if the model supports it
+        """
+        # [0] to access first input array/output array
+        pred_data = DataArray(raw_data, dims=tuple(pp.input_specs[0].axes))
+        try:
+            return predict_with_batched_tiling(
+                pp, pred_data, max_batch=self._max_prediction_batch
+            )
+        except NotImplementedError:
+            try:
+                return list(
+                    predict_with_tiling(pp, pred_data, True, verbose=True)
+                )
+            except NotImplementedError as e:
+                return list(pp(pred_data))
+
     def save(self):
         """
         Save model to file
@@ -880,7 +1076,12 @@ class ModelWidget(QWidget):
             if val_loss is not None:
                 self.__val_iterations.append(iteration)
                 self.__val_losses.append(val_loss)
-            self.update_progress_plot()
+            # redrawing every iteration floods the event loop when
+            # training is fast, the plot catches up on the next redraw
+            now = time.monotonic()
+            if now - self.__last_plot_update > self._plot_update_interval:
+                self.__last_plot_update = now
+                self.update_progress_plot()
 
     def on_return(self, weights_path: Path):
         """
@@ -888,42 +1089,27 @@ class ModelWidget(QWidget):
         """
         assert self.model is not None
         self.model.weights["pytorch_state_dict"].source = weights_path
+        drop_exported_weights(self.model)
         self.reset_training_state(keep_stats=True)
+        self.update_progress_plot()
         self.disable_buttons(snapshot=True, async_predict=True)
 
-    def add_layers(self, layers):
-        viewer_axis_labels = self.viewer.dims.axis_labels
-
+    def prepare_layers(self, layers) -> List[PreparedLayer]:
+        """
+        Do all array manipulation needed to display `layers`. This is
+        called from worker threads so that the GUI thread only has to hand
+        the final arrays to the viewer in `add_layers`.
+        """
+        prepared = []
         for data, metadata, layer_type in layers:
-            # then try to update the viewer layer with that name.
             name = metadata.pop("name")
             axes = metadata.pop("axes")
             overwrite = metadata.pop("overwrite", False)
             slices = metadata.pop("slices", None)
             shape = metadata.pop("shape", None)
 
-            # handle viewer axes if still default numerics
-            # TODO: Support using xarray axis labels as soon as napari does
-            if len(set(viewer_axis_labels).intersection(set(axes))) == 0:
-                spatial_axes = [
-                    axis for axis in axes if axis not in ["batch", "channel"]
-                ]
-                assert (
-                    len(viewer_axis_labels) - len(spatial_axes) <= 1
-                ), f"Viewer has axes: {viewer_axis_labels}, but we expect ((channels), {spatial_axes})"
-                viewer_axis_labels = (
-                    ("channels", *spatial_axes)
-                    if len(viewer_axis_labels) > len(spatial_axes)
-                    else spatial_axes
-                )
-                self.viewer.dims.axis_labels = viewer_axis_labels
-
-            batch_dim = axes.index("batch") if "batch" in axes else -1
-            assert batch_dim in [
-                -1,
-                0,
-            ], f"Batch dim must be first"
-            if batch_dim == 0:
+            meta = self.layer_meta(axes)
+            if meta.batch_dim == 0:
                 data = data[0]
 
             if slices is not None and shape is not None:
@@ -939,38 +1125,130 @@ class ModelWidget(QWidget):
                 slices = tuple(slice(None, None) for _ in data.shape)
                 full_data = data
 
+            if layer_type == "labels":
+                full_data = full_data.astype(int)
+
+            prepared.append(
+                PreparedLayer(
+                    name,
+                    axes,
+                    meta,
+                    data,
+                    full_data,
+                    slices,
+                    overwrite,
+                    metadata,
+                    layer_type,
+                )
+            )
+        return prepared
+
+    def layer_meta(self, axes) -> LayerMeta:
+        """
+        Get the cached `LayerMeta` for layers with `axes`
+        """
+        axes = tuple(axes)
+        meta = self.__layer_meta.get(axes)
+        if meta is None:
+            batch_dim = axes.index("batch") if "batch" in axes else -1
+            assert batch_dim in [
+                -1,
+                0,
+            ], f"Batch dim must be first"
+            spatial_axes = tuple(
+                axis for axis in axes if axis not in ["batch", "channel"]
+            )
+            meta = LayerMeta(batch_dim, spatial_axes)
+            self.__layer_meta[axes] = meta
+        return meta
+
+    def add_layers(self, layers: List[PreparedLayer]):
+        viewer_axis_labels = self.viewer.dims.axis_labels
+
+        for layer_data in layers:
+            # then try to update the viewer layer with that name.
+            name = layer_data.name
+            axes = layer_data.axes
+
+            # handle viewer axes if still default numerics
+            # TODO: Support using xarray axis labels as soon as napari does
+            if set(viewer_axis_labels).isdisjoint(axes):
+                spatial_axes = layer_data.meta.spatial_axes
+                assert (
+                    len(viewer_axis_labels) - len(spatial_axes) <= 1
+                ), f"Viewer has axes: {viewer_axis_labels}, but we expect ((channels), {spatial_axes})"
+                viewer_axis_labels = (
+                    ("channels", *spatial_axes)
+                    if len(viewer_axis_labels) > len(spatial_axes)
+                    else spatial_axes
+                )
+                self.viewer.dims.axis_labels = viewer_axis_labels
+
             try:
                 # add to existing layer
                 layer = self.viewer.layers[name]
 
-                if overwrite:
-                    layer.data[slices] = data
+                if layer_data.overwrite:
+                    layer.data[layer_data.slices] = layer_data.data
                     layer.refresh()
                 else:
-                    # concatenate along batch dimension
-                    layer.data = np.concatenate(
-                        [
-                            layer.data.reshape(-1, *full_data.shape),
-                            full_data.reshape(-1, *full_data.shape).astype(
-                                layer.data.dtype
-                            ),
-                        ],
-                        axis=0,
+                    # append along batch dimension
+                    layer.data = self.append_to_layer_data(
+                        name, layer.data, layer_data.full_data
                     )
                 # make first dimension "batch" if it isn't
-                if not overwrite and viewer_axis_labels[0] != "batch":
+                if (
+                    not layer_data.overwrite
+                    and viewer_axis_labels[0] != "batch"
+                ):
                     viewer_axis_labels = ("batch", *viewer_axis_labels)
                     self.viewer.dims.axis_labels = viewer_axis_labels
 
             except KeyError:  # layer not in the viewer
                 # TODO: Support defining layer axes as soon as napari does
-                if layer_type == "image":
-                    self.viewer.add_image(full_data, name=name, **metadata)
-                elif layer_type == "labels":
+                if layer_data.layer_type == "image":
+                    self.viewer.add_image(
+                        layer_data.full_data, name=name, **layer_data.metadata
+                    )
+                elif layer_data.layer_type == "labels":
                     self.viewer.add_labels(
-                        full_data.astype(int), name=name, **metadata
+                        layer_data.full_data, name=name, **layer_data.metadata
                     )
 
+    def append_to_layer_data(self, name, layer_data, data):
+        """
+        Append `data` to `layer_data` along a leading batch dimension.
+        Samples are copied into a per layer buffer that doubles its capacity
+        when full, the returned array is a view of the filled part of it.
+        """
+        buffer, view = self.__layer_buffers.get(name, (None, None))
+        if view is None or layer_data is not view:
+            # layer data was set elsewhere, start a new buffer from it
+            history = layer_data.reshape(-1, *data.shape)
+            buffer = None
+        else:
+            history = view
+        used = history.shape[0]
+        needed = used + 1
+
+        if buffer is None or buffer.shape[0] < needed:
+            capacity = 1 << (needed - 1).bit_length()
+            new_buffer = np.empty(
+                (capacity, *data.shape), dtype=layer_data.dtype
+            )
+            new_buffer[:used] = history
+            buffer = new_buffer
+        buffer[used] = data
+        view = buffer[:needed]
+        self.__layer_buffers[name] = (buffer, view)
+        return view
+
+    def drop_layer_buffer(self, event):
+        """
+        Free the buffer of a layer removed from the viewer
+        """
+        self.__layer_buffers.pop(event.value.name, None)
+
     @thread_worker
     def train_affinities(
         self,
@@ -988,6 +1266,8 @@ class ModelWidget(QWidget):
             )
 
         model = deepcopy(self.model)
+        # online predictions use the weights being trained
+        drop_exported_weights(model)
 
         outputs = model.outputs
         metadata_output_names = [output.name.lower() for output in outputs]
@@ -1029,19 +1309,90 @@ class ModelWidget(QWidget):
         torch_module = get_torch_module(model)
 
         # define Loss function and Optimizer TODO: make options available as choices?
-        lsd_loss_func = torch.nn.MSELoss()
+        lsd_loss_func = masked_mse_loss
         # aff_loss_func = torch.nn.BCEWithLogitsLoss()
-        aff_loss_func = torch.nn.BCELoss()
-        fgbg_loss_func = torch.nn.MSELoss()  # TODO: add support for DiceLoss
-        optimizer = torch.optim.Adam(params=torch_module.parameters())
+        aff_loss_func = masked_bce_loss
+        fgbg_loss_func = masked_mse_loss  # TODO: add support for DiceLoss
 
         # TODO: How to display profiling stats
-        if torch.cuda.is_available():
-            device = torch.device("cuda")
-        else:
-            device = torch.device("cpu")
+        device = self.device
         torch_module = torch_module.to(device)
         torch_module.train()
+        # channels last layouts let cudnn use faster (tensor core)
+        # convolution kernels, inputs are converted when copied to the gpu
+        memory_format = None
+        if device.type == "cuda" and ndim in (2, 3):
+            memory_format = (
+                torch.channels_last if ndim == 2 else torch.channels_last_3d
+            )
+            torch_module = torch_module.to(memory_format=memory_format)
+        # update all parameters with a handful of kernels instead of
+        # looping over every parameter tensor. Older torch versions reject
+        # or don't support these options, use the plain Adam there.
+        optimizer_options = [{"foreach": True}]
+        if device.type == "cuda":
+            optimizer_options.insert(0, {"fused": True})
+        parameters = list(torch_module.parameters())
+        for options in optimizer_options:
+            try:
+                optimizer = torch.optim.Adam(params=parameters, **options)
+                break
+            except (TypeError, ValueError, RuntimeError):
+                continue
+        else:
+            optimizer = torch.optim.Adam(params=parameters)
+        to_device = HostToDevice(device, memory_format)
+        to_host = DeviceToHost(device)
+
+        # on the gpu run the forward pass through a compiled module
+        if supports_compile(device):
+            forward = CompiledWithFallback(torch_module)
+            # fuse masking and squared error into a single kernel
+            lsd_loss_func = fgbg_loss_func = CompiledWithFallback(
+                masked_mse_loss, fullgraph=True
+            )
+        elif not hasattr(torch, "compile"):
+            # torch versions without torch.compile trace the module to
+            # torchscript on the first training batch, so shapes derived
+            # from the batch size match training. The traced module shares
+            # parameters with `torch_module`, which is still used for
+            # checkpoints. Newer versions deprecate tracing and run the
+            # module eagerly when it can't be compiled.
+            forward = None
+        else:
+            forward = torch_module
+
+        def run_forward(inputs, trace=False):
+            nonlocal forward
+            if forward is None and trace:
+                try:
+                    forward = torch.jit.trace(
+                        torch_module, inputs, check_trace=False
+                    )
+                except Exception as e:
+                    warnings.warn(
+                        f"Tracing the model failed ({e}), running it "
+                        "eagerly instead"
+                    )
+                    forward = torch_module
+            if forward is None:
+                return torch_module(inputs)
+            return forward(inputs)
+
+        # weights only change while training, so a checkpoint is only
+        # written again once training continued since the last one
+        checkpoint = None
+        checkpoint_iteration = None
+
+        def save_checkpoint():
+            nonlocal checkpoint, checkpoint_iteration
+            if checkpoint is None or checkpoint_iteration != iteration:
+                checkpoint = Path(f"/tmp/checkpoints/{iteration}.pt")
+                if not checkpoint.parent.exists():
+                    checkpoint.parent.mkdir(parents=True)
+                torch.save(torch_module.state_dict(), checkpoint)
+                checkpoint_iteration = iteration
+            return checkpoint
 
         # prepare data for full volume prediction
         raw_data = raw.data
@@ -1051,26 +1402,43 @@ class ModelWidget(QWidget):
         # Train loop:
         with self.build_pipeline(
             raw, gt, mask, parameters, affs_high_inter_object
-        ) as pipeline:
+        ) as pipeline, self.free_prediction_pipeline():
             mode = yield (None, None, None)
             while True:
 
                 if mode == "predict":
-                    checkpoint = Path(f"/tmp/checkpoints/{iteration}.pt")
-                    if not checkpoint.parent.exists():
-                        checkpoint.parent.mkdir(parents=True)
-                    torch.save(torch_module.state_dict(), checkpoint)
-                    model.weights["pytorch_state_dict"].source = checkpoint
-
                     # Assuming raw data comes in with a channel dim
                     # This doesn't have to be the case, in which case
                     # plugin will fail.
                     # TODO: How to determine axes of raw data. metadata?
                     # guess? simply make it fit what the model expects?
 
-                    predictions = tuple(
-                        self._predict(model, raw_data, offsets)
-                    )
+                    if has_processing(model):
+                        # the bioimageio pipeline applies the processing
+                        # but needs to load the weights from disk
+                        model.weights["pytorch_state_dict"].source = (
+                            save_checkpoint()
+                        )
+                        predictions = tuple(
+                            self._predict(model, raw_data, offsets)
+                        )
+                    else:
+                        # predict with the module being trained, this
+                        # skips writing and reloading the weights
+                        torch_module.eval()
+                        try:
+                            predictions = tuple(
+                                self._predict(
+                                    model,
+                                    raw_data,
+                                    offsets,
+                                    ModulePredictor(
+                                        model, torch_module, device
+                                    ),
+                                )
+                            )
+                        finally:
+                            torch_module.train()
 
                     # Generate affinities and keep the offsets as metadata
                     prediction_layers = [
@@ -1117,7 +1485,12 @@ class ModelWidget(QWidget):
                                 "image",
                             ),
                         )
-                    mode = yield (None, None, None, *prediction_layers)
+                    mode = yield (
+                        None,
+                        None,
+                        None,
+                        *self.prepare_layers(prediction_layers),
+                    )
                 elif mode is None or mode == "snapshot":
                     snapshot_iteration = mode == "snapshot"
                     val_loss = None
@@ -1125,9 +1498,10 @@ class ModelWidget(QWidget):
                     if iteration % self._validation_interval == 0:
                         val_arrays = pipeline.next_validation()
                         val_tensors = [
-                            torch.as_tensor(array, device=device).float()
-                            for array, _, _ in val_arrays
+                            to_device(("validation", i), array)
+                            for i, (array, _, _) in enumerate(val_arrays)
                         ]
+                        to_device.wait()
                         (
                             val_raw,
                             val_aff_target,
@@ -1145,37 +1519,47 @@ class ModelWidget(QWidget):
                                 val_fgbg_target,
                                 val_fgbg_mask,
                             ) = val_optional_arrays
-                        val_outputs = tuple(torch_module(val_raw))
+                        # validation never backpropagates, don't keep
+                        # activations around for it
+                        with torch.no_grad():
+                            val_outputs = run_forward(val_raw)
 
                         val_affs_loss = aff_loss_func(
-                            val_outputs[affs_index][-len(offsets) :]
-                            * val_aff_mask,
-                            val_aff_target * val_aff_mask,
+                            val_outputs[affs_index][-len(offsets) :],
+                            val_aff_target,
+                            val_aff_mask,
                         )
 
                         val_losses = [val_affs_loss]
                         if lsds:
                             val_lsd_loss = lsd_loss_func(
-                                val_outputs[lsd_index] * val_lsd_mask,
-                                val_lsd_target * val_lsd_mask,
+                                val_outputs[lsd_index],
+                                val_lsd_target,
+                                val_lsd_mask,
+                            )
+                            val_losses.append(
+                                self._lsd_loss_weight * val_lsd_loss
                             )
-                            val_losses.append(val_lsd_loss)
                         if fgbg:
                             val_fgbg_loss = fgbg_loss_func(
-                                val_outputs[fgbg_index] * val_fgbg_mask,
-                                val_fgbg_target * val_fgbg_mask,
+                                val_outputs[fgbg_index],
+                                val_fgbg_target,
+                                val_fgbg_mask,
                             )
                             val_losses.append(val_fgbg_loss)
 
-                        val_loss = sum(val_losses)
+                        # start from the first loss rather than from 0 to
+                        # skip adding a python scalar to a tensor
+                        val_loss = sum(val_losses[1:], val_losses[0])
 
                     # fetch data:
                     arrays, snapshot_arrays = pipeline.next(snapshot_iteration)
 
                     tensors = [
-                        torch.as_tensor(array, device=device).float()
-                        for array, _, _ in arrays
+                        to_device(("train", i), array)
+                        for i, (array, _, _) in enumerate(arrays)
                     ]
+                    to_device.wait()
                     raw, aff_target, aff_mask, *optional_arrays = tensors
                     if lsds:
                         (
@@ -1185,40 +1569,61 @@ class ModelWidget(QWidget):
                         ) = optional_arrays
                     if fgbg:
                         fgbg_target, fgbg_mask = optional_arrays
-                    outputs = tuple(torch_module(raw))
+                    outputs = run_forward(raw, trace=True)
+
+                    if snapshot_iteration:
+                        # start copying predictions to the host now so that
+                        # the copies overlap with the backward pass
+                        snapshot_outputs = [outputs[affs_index]]
+                        if lsds:
+                            snapshot_outputs.append(outputs[lsd_index])
+                        if fgbg:
+                            snapshot_outputs.append(outputs[fgbg_index])
+                        to_host(snapshot_outputs)
 
                     affs_loss = aff_loss_func(
-                        outputs[affs_index][-len(offsets) :] * aff_mask,
-                        aff_target * aff_mask,
+                        outputs[affs_index][-len(offsets) :],
+                        aff_target,
+                        aff_mask,
                     )
 
                     losses = [affs_loss]
                     if lsds:
                         lsd_loss = lsd_loss_func(
-                            outputs[lsd_index] * lsd_mask,
-                            lsd_target * lsd_mask,
+                            outputs[lsd_index], lsd_target, lsd_mask
                         )
-                        losses.append(lsd_loss)
+                        losses.append(self._lsd_loss_weight * lsd_loss)
                     if fgbg:
                         fgbg_loss = fgbg_loss_func(
-                            outputs[fgbg_index] * fgbg_mask,
-                            fgbg_target * fgbg_mask,
+                            outputs[fgbg_index], fgbg_target, fgbg_mask
                         )
                         losses.append(fgbg_loss)
 
-                    loss = sum(losses)
+                    loss = sum(losses[1:], losses[0])
 
-                    optimizer.zero_grad()
+                    optimizer.zero_grad(set_to_none=True)
                     loss.backward()
                     optimizer.step()
 
                     iteration += 1
 
+                    # convert losses to floats here in the worker, the GUI
+                    # thread should never have to wait on the device
+                    loss_value = loss.item()
+                    val_loss_value = (
+                        val_loss.item() if val_loss is not None else None
+                    )
+
                     if snapshot_iteration:
+                        aff_pred, *optional_preds = to_host.wait()
+                        if lsds:
+                            lsd_pred, *optional_preds = optional_preds
+                        if fgbg:
+                            (fgbg_pred,) = optional_preds
                         pred_arrays = []
                         pred_arrays.append(
                             (
-                                outputs[affs_index].detach().cpu().numpy(),
+                                aff_pred,
                                 {
                                     "name": "sample_aff_pred",
                                     "axes": (
@@ -1233,7 +1638,7 @@ class ModelWidget(QWidget):
                         if lsds:
                             pred_arrays.append(
                                 (
-                                    outputs[lsd_index].detach().cpu().numpy(),
+                                    lsd_pred,
                                     {
                                         "name": "sample_lsd_pred",
                                         "axes": (
@@ -1248,7 +1653,7 @@ class ModelWidget(QWidget):
                         if fgbg:
                             pred_arrays.append(
                                 (
-                                    outputs[fgbg_index].detach().cpu().numpy(),
+                                    fgbg_pred,
                                     {
                                         "name": "sample_fgbg_pred",
                                         "axes": (
@@ -1262,28 +1667,20 @@ class ModelWidget(QWidget):
                             )
                         mode = yield (
                             iteration,
-                            loss.detach().cpu().item(),
-                            val_loss.detach().cpu().item()
-                            if val_loss is not None
-                            else None,
-                            *arrays,
-                            *snapshot_arrays,
-                            *pred_arrays,
+                            loss_value,
+                            val_loss_value,
+                            *self.prepare_layers(
+                                [*arrays, *snapshot_arrays, *pred_arrays]
+                            ),
                         )
                     else:
                         mode = yield (
                             iteration,
-                            loss.detach().cpu().item(),
-                            val_loss.detach().cpu().item()
-                            if val_loss is not None
-                            else None,
+                            loss_value,
+                            val_loss_value,
                         )
                 elif mode == "stop":
-                    checkpoint = Path(f"/tmp/checkpoints/{iteration}.pt")
-                    if not checkpoint.parent.exists():
-                        checkpoint.parent.mkdir(parents=True)
-                    torch.save(torch_module.state_dict(), checkpoint)
-                    return checkpoint
+                    return save_checkpoint()
                 else:
                     raise ValueError(
                         f"Unknown message passed to train worker: ({mode})"